@@ -0,0 +1,215 @@
+'''Async serving entry point for the match and ingest endpoints.
+
+Run with:  uvicorn asgi_app:app --workers 4   (or python asgi_app.py)
+
+Encoding, scoring and SQLite work run on sized thread pools. Each endpoint has
+a concurrency limit and a bounded wait queue; requests beyond the queue are
+shed with 429 and a Retry-After estimate, and every request has a deadline
+that covers both its queue wait and its execution.
+'''
+
+import asyncio
+import json
+import logging
+import math
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Tuple
+
+from ats_system import ATSSystem, parse_match_request, format_match_response
+from storage import store_job_matches, insert_candidate
+
+logging.basicConfig(level=logging.INFO)
+
+MATCH_WORKERS = int(os.environ.get("ATS_MATCH_WORKERS", 4))
+MATCH_MAX_QUEUE = int(os.environ.get("ATS_MATCH_MAX_QUEUE", 16))
+INGEST_WORKERS = int(os.environ.get("ATS_INGEST_WORKERS", 2))
+INGEST_MAX_QUEUE = int(os.environ.get("ATS_INGEST_MAX_QUEUE", 32))
+REQUEST_DEADLINE_MS = int(os.environ.get("ATS_REQUEST_DEADLINE_MS", 10000))
+# Share of the remaining request deadline given to ranking, the rest covers storing and replying
+RANKING_BUDGET_SHARE = 0.8
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Concurrency limit plus queue-depth load shedding for one endpoint.
+
+    Up to max_concurrency requests run on a dedicated executor of the same
+    size; up to max_queue more wait for a slot, anything beyond is rejected.
+    A slot is only released when the executor work has really finished, so a
+    timed-out request cannot oversubscribe the pool.
+    """
+    def __init__(self, name: str, max_concurrency: int, max_queue: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=name)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.avg_service_time = 1.0  # Seconds, exponentially weighted
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue should have drained"""
+        backlog = (self.waiting + self.max_concurrency) / self.max_concurrency
+        return max(1, math.ceil(backlog * self.avg_service_time))
+
+    async def run(self, deadline: float, fn, *args):
+        loop = asyncio.get_running_loop()
+        if not self.semaphore.locked():
+            # A slot is free, acquiring it does not suspend
+            await self.semaphore.acquire()
+        elif self.waiting >= self.max_queue:
+            raise Overloaded(self.retry_after())
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), timeout=deadline - loop.time())
+            finally:
+                self.waiting -= 1
+
+        started = loop.time()
+
+        def release(_):
+            service_time = loop.time() - started
+            self.avg_service_time = 0.8 * self.avg_service_time + 0.2 * service_time
+            self.semaphore.release()
+
+        future = loop.run_in_executor(self.executor, fn, *args)
+        future.add_done_callback(release)
+        return await asyncio.wait_for(asyncio.shield(future), timeout=deadline - loop.time())
+
+
+class ATSApp:
+    def __init__(self):
+        self.ats = None
+        self.match_admission = None
+        self.ingest_admission = None
+
+    async def startup(self):
+        # Semaphores must be created on the serving loop
+        self.match_admission = AdmissionController("match", MATCH_WORKERS, MATCH_MAX_QUEUE)
+        self.ingest_admission = AdmissionController("ingest", INGEST_WORKERS, INGEST_MAX_QUEUE)
+
+        loop = asyncio.get_running_loop()
+        self.ats = await loop.run_in_executor(None, ATSSystem)
+
+    async def shutdown(self):
+        for admission in (self.match_admission, self.ingest_admission):
+            if admission is not None:
+                admission.executor.shutdown(wait=False)
+
+    def _match(self, job_json: Dict[str, Any], received_at: float, deadline_ms: float) -> Dict[str, Any]:
+        # Time spent waiting for a slot, reported with the pipeline stages
+        queue_wait_ms = (time.perf_counter() - received_at) * 1000
+        stage_timings = {'queue_wait': queue_wait_ms}
+        job, retrieval_mode, match_deadline_ms = parse_match_request(job_json)
+
+        # Without an explicit deadline_ms, rank within what is left of the request
+        # deadline so a slow match degrades instead of timing out
+        if match_deadline_ms is None:
+            match_deadline_ms = max(1.0, (deadline_ms - queue_wait_ms) * RANKING_BUDGET_SHARE)
+        degraded = []
+        start_time = time.time()
+        ranked_candidates = self.ats.rank_candidates(job, retrieval_mode=retrieval_mode, top_k=100,
+                                                     timings=stage_timings, deadline_ms=match_deadline_ms,
+                                                     degraded=degraded)
+        execution_time = time.time() - start_time
+        store_start = time.perf_counter()
+        job_id = store_job_matches(job_json, execution_time, ranked_candidates)
+        stage_timings['store'] = (time.perf_counter() - store_start) * 1000
+        return format_match_response(job_id, execution_time, ranked_candidates,
+                                     stage_timings=stage_timings, degraded=degraded)
+
+    def _ingest(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        candidate_id = insert_candidate(data, self.ats.embedding_manager)
+        return {'status': 'success', 'id': candidate_id}
+
+    async def handle(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+        loop = asyncio.get_running_loop()
+        received_at = time.perf_counter()
+        try:
+            deadline_ms = int(headers.get('x-request-deadline-ms', REQUEST_DEADLINE_MS))
+        except ValueError:
+            return 400, {'error': 'Invalid X-Request-Deadline-Ms header'}, {}
+        deadline = loop.time() + deadline_ms / 1000
+
+        if method != 'POST' or path not in ('/api/match-candidates', '/api/candidates'):
+            return 404, {'error': 'Not found'}, {}
+
+        try:
+            payload = json.loads(body) if body else None
+        except ValueError:
+            payload = None
+        if not payload:
+            return 400, {'error': 'No data provided'}, {}
+        if not isinstance(payload, dict):
+            return 400, {'error': 'Request body must be a JSON object'}, {}
+
+        try:
+            if path == '/api/match-candidates':
+                return 200, await self.match_admission.run(deadline, self._match, payload, received_at, deadline_ms), {}
+            return 201, await self.ingest_admission.run(deadline, self._ingest, payload), {}
+
+        except Overloaded as e:
+            return 429, {'error': 'Server overloaded, retry later'}, {'retry-after': str(e.retry_after)}
+        except asyncio.TimeoutError:
+            return 504, {'error': f'Deadline of {deadline_ms} ms exceeded'}, {}
+        except sqlite3.IntegrityError:
+            return 400, {'status': 'error', 'message': 'Email already exists'}, {}
+        except ValueError as e:
+            return 400, {'error': f'Invalid data: {str(e)}'}, {}
+        except Exception as e:
+            logging.error(f"Error processing request: {str(e)}")
+            return 500, {'error': 'Internal server error'}, {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    try:
+                        await self.startup()
+                    except Exception as e:
+                        # Reported to the server, which then exits instead of serving 500s
+                        logging.exception("Startup failed")
+                        await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                        return
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await self.shutdown()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+
+        if scope['type'] != 'http':
+            return
+
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+        headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+        status, payload, extra_headers = await self.handle(scope['method'], scope['path'], headers, body)
+
+        response_body = json.dumps(payload).encode()
+        response_headers = [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(response_body)).encode())]
+        response_headers += [(k.encode(), v.encode()) for k, v in extra_headers.items()]
+        await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': response_body})
+
+
+app = ATSApp()
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='127.0.0.1', port=int(os.environ.get("ATS_PORT", 5000)))
@@ -3,17 +3,21 @@
 import os
 os.environ['CURL_CA_BUNDLE'] = ''
 
+import re
 import sqlite3
 import json
-from typing import List, Dict, Any
-from dataclasses import dataclass
-from sentence_transformers import SentenceTransformer
+from typing import List, Dict, Any, Optional, Tuple
+from dataclasses import dataclass, field
+import time
+from collections import deque
 import numpy as np
 import logging
-import chromadb
-from chromadb.utils import embedding_functions
-from sentence_transformers import SentenceTransformer
-from build_db import EmbeddingManager
+from datetime import datetime, timedelta
+# Heavy modules (chromadb, sentence_transformers) are only imported when EmbeddingManager is built
+from embeddings import EmbeddingManager, STARTUP_TIMINGS, startup_report
+from storage import init_db, EDUCATION_LEVELS
+from snapshot import CandidateSnapshot, hydrate_candidates
+from embedding_snapshot import EmbeddingSnapshot, SNAPSHOT_DIR
 
 # Configure the logging system
 logging.basicConfig(
@@ -25,6 +29,12 @@ logging.basicConfig(
     ]
 )
 
+# Reciprocal rank fusion constant, the usual value from the RRF paper
+RRF_K = 60
+
+# Largest year count accepted in a job constraint
+MAX_CONSTRAINT_YEARS = 100
+
 # Data Models
 @dataclass
 class Experience:
@@ -33,6 +43,12 @@ class Experience:
     start_date: str
     end_date: str
     duration_years: float
+    role_key: str = ""  # Lowercased role, precomputed at ingest
+
+    def __post_init__(self):
+        # Rows ingested before role_key existed fall back to computing it here
+        if not self.role_key:
+            self.role_key = self.role.lower()
     
     def to_text(self) -> str:
         return f"{self.role} at {self.company}"
@@ -54,6 +70,12 @@ class Candidate:
     skills: List[str]
     experiences: List[Experience]
     education: List[Education]
+    skills_key: Tuple[str, ...] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        # Skills are already enriched at ingest, only the case folding is left.
+        # Aligned with skills, so matches can be reported in their original case
+        self.skills_key = tuple(s.lower() for s in self.skills)
     
     @property
     def full_name(self) -> str:
@@ -65,6 +87,10 @@ class Job:
     title: str
     description: str
     required_skills: List[str]
+    budget: Optional[Dict[str, Any]] = None
+    # Optional structured constraints applied to the candidate snapshot before any scoring:
+    # min_years_experience, min_education_level, max_years_since_last_role, within_budget
+    constraints: Dict[str, Any] = field(default_factory=dict)
     
     def to_job_text(self) -> str:
         """Convert job to a single text for embedding"""
@@ -90,47 +116,181 @@ class SkillEnricher:
                 enriched_skills.update(self.skill_relations[skill_lower])
         return list(enriched_skills)
 
+def _build_skill_automaton(skills):
+    """Aho-Corasick automaton over the skills: goto tables, failure links and match flags"""
+    goto = [{}]
+    terminal = [False]
+    for skill in skills:
+        state = 0
+        for ch in skill:
+            next_state = goto[state].get(ch)
+            if next_state is None:
+                next_state = len(goto)
+                goto[state][ch] = next_state
+                goto.append({})
+                terminal.append(False)
+            state = next_state
+        terminal[state] = True
+
+    # Breadth-first, so the failure target of a state is always finished before it
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for ch, next_state in goto[state].items():
+            target = fail[state]
+            while target and ch not in goto[target]:
+                target = fail[target]
+            fail[next_state] = goto[target].get(ch, 0)
+            terminal[next_state] = terminal[next_state] or terminal[fail[next_state]]
+            queue.append(next_state)
+    return goto, fail, terminal
+
+class JobMatcher:
+    """Job-side matching state, compiled once per request and shared by every candidate"""
+    def __init__(self, job: Job, skill_enricher: SkillEnricher):
+        self.enriched_skills = set(skill_enricher.enrich_skills(job.required_skills))
+        self.enriched_skills_key = frozenset(s.lower() for s in self.enriched_skills)
+
+        # Automaton over all enriched skills, so a role is scanned once, character
+        # by character, however many skills the job has
+        self._goto, self._fail, self._terminal = _build_skill_automaton(self.enriched_skills_key)
+
+    def matched_skills(self, candidate: Candidate) -> List[str]:
+        return [s for s, key in zip(candidate.skills, candidate.skills_key) if key in self.enriched_skills_key]
+
+    def role_matches(self, experience: Experience) -> bool:
+        """True when any enriched skill occurs in the role"""
+        goto, fail, terminal = self._goto, self._fail, self._terminal
+        if terminal[0]:
+            return True
+        state = 0
+        for ch in experience.role_key:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if terminal[state]:
+                return True
+        return False
+
+RETRIEVAL_MODES = ("filter", "ann")
+
 class ATSSystem:
-    def __init__(self):
-        self.embedding_manager = EmbeddingManager()
+    def __init__(self, retrieval_mode: str = "filter", ann_top_m: int = 200,
+                 hnsw_m: int = 16, hnsw_search_ef: int = 100,
+                 embedding_snapshot_dir: Optional[str] = SNAPSHOT_DIR):
+        """
+        Args:
+            retrieval_mode: "filter" runs the skill/lexical pre-filter and scores the
+                pool against Chroma, "ann" takes the ann_top_m nearest profiles from
+                the HNSW index first and only scores those
+            ann_top_m: Number of nearest profiles retrieved in "ann" mode
+            hnsw_m: HNSW graph degree, applied when the collection is created
+            hnsw_search_ef: HNSW query-time ef, higher is better recall but slower
+            embedding_snapshot_dir: Directory of the memory-mapped embedding snapshot
+                (see embedding_snapshot.py), None to always score against Chroma
+        """
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {retrieval_mode}")
+        self.retrieval_mode = retrieval_mode
+        self.ann_top_m = ann_top_m
+        self.embedding_manager = EmbeddingManager(hnsw_m=hnsw_m, hnsw_search_ef=hnsw_search_ef)
         self.model = self.embedding_manager.model
         self.skill_enricher = SkillEnricher()
+        # Make sure the derived pre-filter columns exist on older databases
+        start = time.perf_counter()
+        init_db()
+        STARTUP_TIMINGS["init_db"] = time.perf_counter() - start
+        logging.info(f"Startup report: {self.startup_report()}")
+
+        # Columnar copy of the scoring fields, refreshed incrementally before each match
+        self.snapshot = CandidateSnapshot()
+        self.snapshot.refresh()
+
+        # Shared read-only vectors, used for exact scores when a snapshot has been exported
+        self.embedding_snapshot = EmbeddingSnapshot(embedding_snapshot_dir) if embedding_snapshot_dir else None
+
+        # Moving averages of stage costs in ms, used to plan deadline-aware matches.
+        # Exact scores from the snapshot are one mat-vec, through Chroma's id filter
+        # they cost more than a single HNSW query; the averages take over from here
+        snapshot_loaded = self.embedding_snapshot is not None and self.embedding_snapshot.version is not None
+        self.stage_costs = {
+            "exact_per_candidate": 0.002 if snapshot_loaded else 0.05,
+            "approx_per_candidate": 0.02,
+            "explain_per_candidate": 0.2,
+        }
+
+    def startup_report(self) -> Dict[str, float]:
+        """Seconds spent on heavy imports, model load, ChromaDB open and schema checks"""
+        return startup_report()
+
+    def _constraint_conditions(self, job: Job):
+        """Translate the job constraints into SQL conditions and parameters for the lexical stage"""
+        constraints = job.constraints or {}
+        conditions = []
+        params = []
+
+        if constraints.get("min_years_experience") is not None:
+            # Closed roles plus the time elapsed so far in the ongoing one
+            conditions.append("c.closed_experience_years + COALESCE(julianday('now') - julianday(c.ongoing_role_start), 0) / 365 >= ?")
+            params.append(float(constraints["min_years_experience"]))
+
+        if constraints.get("min_education_level") is not None:
+            conditions.append("c.education_rank >= ?")
+            params.append(EDUCATION_LEVELS.index(constraints["min_education_level"]))
+
+        if constraints.get("max_years_since_last_role") is not None:
+            cutoff = datetime.now() - timedelta(days=365 * float(constraints["max_years_since_last_role"]))
+            conditions.append("c.last_role_end >= ?")
+            params.append(cutoff.strftime("%Y-%m-%d"))
+
+        # Candidates without a salary expectation are kept
+        if constraints.get("within_budget") and job.budget and job.budget.get("max") is not None:
+            conditions.append("(c.expected_salary IS NULL OR c.expected_salary <= ?)")
+            params.append(float(job.budget["max"]))
+
+        return conditions, params
         
-        
-    def filter_candidates(self, job: Job):
-        required_skills = job.required_skills
-        
-        # Conectarse a la base de datos SQLite
+    def _lexical_query(self, job: Job) -> str:
+        """FTS5 MATCH expression built from the job title and required skills"""
+        terms = []
+        for text in [job.title] + list(job.required_skills):
+            for token in re.findall(r"\w+", text.lower()):
+                if token not in terms:
+                    terms.append(token)
+        return " OR ".join(f'"{token}"' for token in terms)
+
+    def lexical_candidates(self, job: Job, limit: int = 50, ids_only: bool = False):
+        """BM25-ranked candidates from the FTS5 profile index, best first"""
+        match_query = self._lexical_query(job)
+        if not match_query or limit <= 0:
+            return [], []
+
         conn = sqlite3.connect('ats.db')
         c = conn.cursor()
 
-        # Crear una consulta SQL dinámica que use la cláusula LIKE para filtrar por habilidades
-        like_conditions = ' OR '.join([f"skills LIKE '%\"{skill}\"%'" for skill in required_skills])
+        constraint_conditions, constraint_params = self._constraint_conditions(job)
+        where = ' AND '.join(["candidate_profiles_fts MATCH ?"] + constraint_conditions)
+
         query = f"""
-                    SELECT c.*, ce.chroma_index 
-                    FROM candidates c
+                    SELECT {"c.id" if ids_only else "c.*, ce.chroma_index"}
+                    FROM candidate_profiles_fts
+                    JOIN candidates c ON c.id = candidate_profiles_fts.rowid
                     JOIN candidate_embeddings ce ON c.id = ce.candidate_id
-                    WHERE {like_conditions}
+                    WHERE {where}
+                    ORDER BY bm25(candidate_profiles_fts)
+                    LIMIT ?
                 """
-        
-        # Ejecutar la consulta SQL filtrando por habilidades
-        c.execute(query)
-        filtered_candidates = c.fetchall()
+        c.execute(query, [match_query] + constraint_params + [limit])
+        lexical_hits = c.fetchall()
         column_names = [description[0] for description in c.description]
         conn.close()
 
-        return filtered_candidates, column_names
+        return lexical_hits, column_names
 
-    def _calculate_skill_match_score(self, job_skills: List[str], candidate_skills: List[str]) -> float:
-        """Calculate skill match score based on required skills"""
-        candidate_skills_set = set(s.lower() for s in candidate_skills)
-        
-        # Enrich both sets
-        job_skills_enriched = set(self.skill_enricher.enrich_skills(job_skills))
-        job_skills_enriched = set(s.lower() for s in job_skills_enriched)
-        
-        matched_skills = candidate_skills_set.intersection(job_skills_enriched)
-        return len(matched_skills) / len(job_skills_enriched)
+    def build_job_matcher(self, job: Job) -> JobMatcher:
+        """Compile the per-job matcher used for skill scores and explanations"""
+        return JobMatcher(job, self.skill_enricher)
 
     
     def _calculate_semantic_similarity(self, job_embedding: np.ndarray, candidate_indices: List[int]) -> List[float]:
@@ -138,101 +298,253 @@ class ATSSystem:
         Calculate semantic similarity using pre-computed embeddings,
         considering only preselected candidates.
         """
-        similarities = self.embedding_manager.search_candidates(
-            job_embedding=job_embedding,
-            candidate_ids=candidate_indices,
-            k = 100 #len(candidate_indices)
-            )
+        missing = candidate_indices
+        similarities = []
+        if self.embedding_snapshot is not None:
+            # Exact scores from the memory-mapped snapshot, switching to a newer version if published
+            self.embedding_snapshot.maybe_reload()
+            similarities, missing = self.embedding_snapshot.search(job_embedding, candidate_indices)
+
+        # Candidates ingested after the last export are still scored by Chroma
+        if missing:
+            similarities += self.embedding_manager.search_candidates(
+                job_embedding=job_embedding,
+                candidate_ids=missing,
+                k = len(missing)
+                )
+            similarities.sort(key=lambda s: s['similarity'], reverse=True)
         logging.info(f"similarities: {similarities}")
         return similarities
     
 
 
-    def get_match_explanations(self, job: Job, candidate: Candidate) -> Dict[str, Any]:
+    def get_match_explanations(self, job: Job, candidate: Candidate,
+                               matcher: Optional[JobMatcher] = None) -> Dict[str, Any]:
         """Generate explanations for why a candidate matches a job"""
         explanations = {
             "skill_matches": [],
             "experience_relevance": [],
             "education_relevance": []
         }
+        if matcher is None:
+            matcher = self.build_job_matcher(job)
         
         # Skill matches
-        candidate_skills_enriched = set(self.skill_enricher.enrich_skills(candidate.skills))
-        job_skills_enriched = set(self.skill_enricher.enrich_skills(job.required_skills))
-        matched_skills = candidate_skills_enriched.intersection(job_skills_enriched)
-        
-        explanations["skill_matches"] = list(matched_skills)
+        explanations["skill_matches"] = matcher.matched_skills(candidate)
         
         # Experience relevance
         for exp in candidate.experiences:
-            if any(skill.lower() in exp.role.lower() for skill in job_skills_enriched):
+            if matcher.role_matches(exp):
                 explanations["experience_relevance"].append(
                     f"Relevant experience: {exp.role} at {exp.company}"
                 )
         
         return explanations
 
+    def _observe_cost(self, name: str, ms: float):
+        """Update the moving average of a stage cost used to plan deadline-aware matches"""
+        self.stage_costs[name] = 0.8 * self.stage_costs[name] + 0.2 * ms
+
+    def _plan_degradation(self, deadline: Optional[float], pool_size: int, exact_available: bool) -> Dict[str, Any]:
+        """
+        Choose which stages to degrade so the rest of the match fits the deadline
+
+        Stages are given up in order: explanations first, then exact similarity
+        (for a single ANN query, only when that is estimated to be cheaper), then
+        the size of the candidate pool.
+        """
+        plan = {"explanations": True, "exact": exact_available, "pool_cap": None}
+        if deadline is None:
+            return plan
+
+        remaining_ms = (deadline - time.perf_counter()) * 1000
+        explain_ms = self.stage_costs["explain_per_candidate"] * min(pool_size, 100)
+        # In ANN mode the similarities are already known, only explanations are left
+        semantic_ms = self.stage_costs["exact_per_candidate"] * pool_size if exact_available else 0.0
+
+        if semantic_ms + explain_ms <= remaining_ms:
+            return plan
+        plan["explanations"] = False
+        if semantic_ms <= remaining_ms:
+            return plan
+
+        # One HNSW query only helps when it costs less than scoring the pool exactly
+        approx_per_candidate = self.stage_costs["approx_per_candidate"]
+        approx_ms = approx_per_candidate * max(pool_size, self.ann_top_m)
+        if approx_ms >= semantic_ms:
+            plan["pool_cap"] = max(1, int(remaining_ms / self.stage_costs["exact_per_candidate"]))
+            return plan
+
+        plan["exact"] = False
+        if approx_ms > remaining_ms:
+            plan["pool_cap"] = max(1, int(remaining_ms / approx_per_candidate))
+        return plan
+
     def rank_candidates(self, job: Job, 
-                       min_skill_match: float = 0.1) -> List[Dict[str, Any]]:
-        """Rank candidates for a job using a hybrid approach"""
-        # Initial filter - Gross Filter
-        candidates, column_names = self.filter_candidates(job)
-        
-        ranked_candidates = []
-        candidate_chroma_indices = []
-        
-        for row in candidates:
-            # Initial skill-based filtering
-            logging.info("Initial skill-based filtering")
-            candidate_dict = dict(zip(column_names, row))
-            chroma_index = candidate_dict.pop('chroma_index') 
-            candidate_chroma_indices.append(chroma_index)
-
-            candidate_dict['skills'] = json.loads(candidate_dict['skills'])
-            candidate = parse_candidate_json(candidate_dict)
-
-            skill_match_score = self._calculate_skill_match_score(
-                job.required_skills, candidate.skills
-            )
-
-            logging.info(skill_match_score)
-            
-            if skill_match_score >= min_skill_match:
-                ranked_candidates.append({
-                    "candidate": candidate,
-                    "skill_match_score": skill_match_score,
-                    "chroma_index": chroma_index
-                })
-        logging.info(ranked_candidates)
+                       min_skill_match: float = 0.1,
+                       lexical_top_n: int = 50,
+                       retrieval_mode: Optional[str] = None,
+                       top_k: Optional[int] = None,
+                       timings: Optional[Dict[str, float]] = None,
+                       deadline_ms: Optional[float] = None,
+                       degraded: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Rank candidates for a job using a hybrid approach
 
-        if ranked_candidates:
-            # Calculate semantic similarities for all candidates at once
-            job_embedding = self.model.encode(job.to_job_text()).astype(np.float32)
-            semantic_scores = self._calculate_semantic_similarity(job_embedding, [c["chroma_index"] for c in ranked_candidates])
-            logging.info(f"Semantic Scores: {semantic_scores}")
-            # Add scores and explanations
-            for candidate_dict in ranked_candidates:
-                chroma_index = candidate_dict['chroma_index']
-                candidate_dict["explanations"] = self.get_match_explanations(job, candidate_dict["candidate"])
+        Filtering and skill scoring run on the columnar candidate snapshot; full
+        profiles are only loaded from SQLite for the top_k results (all when None).
+        When a timings dict is given, the milliseconds spent in each stage are added to it.
+
+        With deadline_ms the ranking is anytime: when the budget runs short it
+        skips or truncates explanations, then swaps exact similarity for an ANN
+        query when past costs say that is cheaper, then caps the candidate pool,
+        and returns the best ranking found in time. The names of the degraded stages are appended to degraded.
+        """
+        deadline = time.perf_counter() + deadline_ms / 1000 if deadline_ms is not None else None
+        if degraded is None:
+            degraded = []
+        stage_start = time.perf_counter()
+
+        def mark(stage: str) -> float:
+            nonlocal stage_start
+            now = time.perf_counter()
+            elapsed_ms = (now - stage_start) * 1000
+            if timings is not None:
+                timings[stage] = timings.get(stage, 0.0) + elapsed_ms
+            stage_start = now
+            return elapsed_ms
+
+        retrieval_mode = retrieval_mode or self.retrieval_mode
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {retrieval_mode}")
+        matcher = self.build_job_matcher(job)
+        semantic_scores = None
+        lexical_ranks = {}
+
+        self.snapshot.refresh()
+        # Every lookup below resolves against this generation, a concurrent refresh
+        # swaps in a longer one that this request must not index into
+        columns = self.snapshot.columns
+        constraint_mask = self.snapshot.constraint_mask(job.constraints, job.budget, columns)
+        if matcher.enriched_skills_key:
+            skill_scores = self.snapshot.skill_counts(matcher.enriched_skills_key, columns) / len(matcher.enriched_skills_key)
+        else:
+            skill_scores = np.zeros(len(columns))
+        mark("prefilter")
+
+        job_embedding = self.model.encode(job.to_job_text()).astype(np.float32)
+        mark("encode")
 
-                for score in semantic_scores:
-                    if int(score['candidate_id']) == chroma_index:
-                        candidate_dict['semantic_score'] = score['similarity']
-                        candidate_dict["score"] = (candidate_dict["skill_match_score"] * 0.4 + score['similarity'] * 0.6)
-                        break
+        if retrieval_mode == "ann":
+            # ANN first - only the top-M nearest profiles go on to skill scoring and constraints
+            semantic_scores = self.embedding_manager.nearest_candidates(job_embedding, k=self.ann_top_m)
+            self._observe_cost("approx_per_candidate", mark("ann_search") / max(self.ann_top_m, 1))
+            in_pool = np.zeros(len(columns), dtype=bool)
+            in_pool[self.snapshot.positions_for_chroma((int(s['candidate_id']) for s in semantic_scores), columns)] = True
+            keep = in_pool & constraint_mask & (skill_scores >= min_skill_match)
+        else:
+            # Initial filter - Gross Filter on the raw required skills
+            skill_hits = self.snapshot.skill_counts(job.required_skills, columns) > 0
+            keep = skill_hits & constraint_mask & (skill_scores >= min_skill_match)
 
-            # Print the updated ranked_candidates
+            # Lexical first stage - BM25 over the full profile text. Lexical hits are
+            # kept even with a low skill score, that is the recall they add
+            lexical_hits, _ = self.lexical_candidates(job, lexical_top_n, ids_only=True)
+            lexical_ids = [row[0] for row in lexical_hits]
+            lexical_ranks = {candidate_id: rank for rank, candidate_id in enumerate(lexical_ids, 1)}
+            keep[self.snapshot.positions_for_ids(lexical_ids, columns)] = True
+            mark("lexical")
+
+        positions = np.flatnonzero(keep)
+        plan = self._plan_degradation(deadline, len(positions), exact_available=semantic_scores is None)
+        if not plan["explanations"]:
+            degraded.append("explanations")
+        if semantic_scores is None and not plan["exact"]:
+            degraded.append("approximate_similarity")
+
+        if plan["pool_cap"] is not None and plan["pool_cap"] < len(positions):
+            # Keep the strongest skill matches, lexical hits first
+            lexical_first = np.asarray([int(columns.ids[pos]) in lexical_ranks for pos in positions])
+            order = np.lexsort((-skill_scores[positions], ~lexical_first))
+            positions = np.sort(positions[order[:plan["pool_cap"]]])
+            degraded.append("candidate_pool")
+
+        ranked_candidates = [{
+            "candidate_id": int(columns.ids[pos]),
+            "skill_match_score": float(skill_scores[pos]),
+            "chroma_index": int(columns.chroma_index[pos]),
+            "lexical_rank": lexical_ranks.get(int(columns.ids[pos]))
+        } for pos in positions]
+        logging.info(f"Candidates after skill-based filtering: {len(ranked_candidates)}")
+
+        if ranked_candidates:
+            # Calculate semantic similarities for all candidates at once (already known in ANN mode)
+            if semantic_scores is None and plan["exact"]:
+                semantic_scores = self._calculate_semantic_similarity(job_embedding, [c["chroma_index"] for c in ranked_candidates])
+                self._observe_cost("exact_per_candidate", mark("semantic") / len(ranked_candidates))
+            elif semantic_scores is None:
+                # Approximate - one unfiltered HNSW query over the whole index
+                k = len(ranked_candidates) if plan["pool_cap"] is not None else max(len(ranked_candidates), self.ann_top_m)
+                semantic_scores = self.embedding_manager.nearest_candidates(job_embedding, k=k)
+                self._observe_cost("approx_per_candidate", mark("semantic") / k)
+                # Pool members the query did not return are at least as far as its
+                # farthest result. They are kept, but with no more semantic credit than
+                # that result and never a positive one, so they rank on skill and
+                # never above pool members the query found nearer
+                farthest = min([score['similarity'] for score in semantic_scores] + [0.0])
+                returned = {int(score['candidate_id']) for score in semantic_scores}
+                semantic_scores += [{
+                    'candidate_id': str(c['chroma_index']),
+                    'similarity': farthest,
+                    'metadata': {'candidate_id': str(c['chroma_index'])}
+                } for c in ranked_candidates if c['chroma_index'] not in returned]
+            logging.info(f"Semantic Scores: {semantic_scores}")
+            semantic_by_index = {int(score['candidate_id']): score for score in semantic_scores}
+            # Add scores
             for candidate_dict in ranked_candidates:
-                print("CANDIDATE")
-                print(candidate_dict)
-            # for candidate_dict, semantic_score in zip(ranked_candidates, semantic_scores):
-            #     candidate_dict["semantic_score"] = float(semantic_score)
-            #     candidate_dict["score"] = (candidate_dict["skill_match_score"] * 0.6 + semantic_score * 0.4)
-            #     candidate_dict["explanations"] = self.get_match_explanations(job, candidate_dict["candidate"])
-            #     logging.info(f"Processed candidate: {candidate_dict['candidate'].full_name} with score: {candidate_dict['score']}")
+                score = semantic_by_index.get(candidate_dict['chroma_index'])
+                if score is not None:
+                    candidate_dict['semantic_score'] = score['similarity']
+                    candidate_dict["score"] = (candidate_dict["skill_match_score"] * 0.4 + score['similarity'] * 0.6)
         
+        # Candidates missing from the embedding store cannot be scored
+        ranked_candidates = [c for c in ranked_candidates if "score" in c]
+
         # Sort by combined score
         ranked_candidates.sort(key=lambda x: x["score"], reverse=True)
+
+        # Reciprocal rank fusion of the hybrid ranking with the BM25 ranking
+        if lexical_ranks:
+            for hybrid_rank, candidate_dict in enumerate(ranked_candidates, 1):
+                fusion_score = 1.0 / (RRF_K + hybrid_rank)
+                if candidate_dict["lexical_rank"] is not None:
+                    fusion_score += 1.0 / (RRF_K + candidate_dict["lexical_rank"])
+                candidate_dict["fusion_score"] = fusion_score
+            ranked_candidates.sort(key=lambda x: x["fusion_score"], reverse=True)
+
+        if top_k is not None:
+            ranked_candidates = ranked_candidates[:top_k]
+        mark("fusion")
+
+        # Hydrate the final results and explain them, in rank order while time allows
+        profiles = hydrate_candidates([c["candidate_id"] for c in ranked_candidates])
+        explained = 0
+        for candidate_dict in ranked_candidates:
+            profile = profiles[candidate_dict["candidate_id"]]
+            profile['skills'] = json.loads(profile['skills'])
+            candidate_dict["candidate"] = parse_candidate_json(profile)
+            if plan["explanations"] and (deadline is None or time.perf_counter() < deadline):
+                candidate_dict["explanations"] = self.get_match_explanations(job, candidate_dict["candidate"], matcher)
+                explained += 1
+            else:
+                candidate_dict["explanations"] = {"skill_matches": [], "experience_relevance": [], "education_relevance": []}
+        if explained < len(ranked_candidates) and "explanations" not in degraded:
+            # Explanations were truncated when the deadline passed
+            degraded.insert(0, "explanations")
+        hydrate_ms = mark("hydrate")
+        if explained:
+            self._observe_cost("explain_per_candidate", hydrate_ms / len(ranked_candidates))
+
         return ranked_candidates
 
 # Usage example
@@ -254,8 +566,84 @@ def parse_candidate_json(candidate) -> Candidate:
     )
 
 def parse_job_json(job_json: Dict) -> Job:
+    constraints = job_json.get("constraints") or {}
+    if not isinstance(constraints, dict):
+        raise ValueError("constraints must be an object")
+    level = constraints.get("min_education_level")
+    if level is not None and level not in EDUCATION_LEVELS:
+        raise ValueError(f"Unknown education level: {level}")
+    # The upper bound keeps the recency cutoff date representable
+    for name in ("min_years_experience", "max_years_since_last_role"):
+        value = constraints.get(name)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))
+                                  or not 0 <= value <= MAX_CONSTRAINT_YEARS):
+            raise ValueError(f"{name} must be a number between 0 and {MAX_CONSTRAINT_YEARS}, got {value!r}")
+
+    budget = job_json.get("budget")
+    if budget is not None and not isinstance(budget, dict):
+        raise ValueError("budget must be an object")
+    for name in ("min", "max"):
+        value = (budget or {}).get(name)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise ValueError(f"budget.{name} must be a number, got {value!r}")
+
     return Job(
         title=job_json["job_title"],
         description=job_json["job_description"],
-        required_skills=job_json["required_skills"]
+        required_skills=job_json["required_skills"],
+        budget=budget,
+        constraints=constraints
     )
+
+def parse_match_request(job_json: Dict):
+    """Validate a match request body, returns the job, the retrieval mode and the optional deadline_ms"""
+    if not isinstance(job_json, dict):
+        raise ValueError("Request body must be a JSON object")
+    try:
+        job = parse_job_json(job_json)
+    except KeyError as e:
+        raise ValueError(f"Missing field: {e}")
+
+    # Optional retrieval mode - "filter" (default) or "ann" for open-ended searches
+    retrieval_mode = job_json.get('retrieval_mode', 'filter')
+    if retrieval_mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {retrieval_mode}")
+
+    # Optional latency budget for anytime ranking
+    deadline_ms = job_json.get('deadline_ms')
+    if deadline_ms is not None:
+        if isinstance(deadline_ms, bool) or not isinstance(deadline_ms, (int, float)) or deadline_ms <= 0:
+            raise ValueError(f"deadline_ms must be a positive number, got {deadline_ms!r}")
+    return job, retrieval_mode, deadline_ms
+
+def format_match_response(job_id: str, execution_time: float,
+                          ranked_candidates: List[Dict[str, Any]], top_n: int = 10,
+                          stage_timings: Optional[Dict[str, float]] = None,
+                          degraded: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Response body of a match request"""
+    response = {
+        'job_id': job_id,
+        'execution_time': execution_time,
+        'top_candidates': []
+    }
+    if stage_timings is not None:
+        # Server-side milliseconds per pipeline stage, read by the load-test harness
+        response['stage_timings'] = {stage: round(ms, 3) for stage, ms in stage_timings.items()}
+    if degraded is not None:
+        # Stages given up to meet deadline_ms, empty when the full pipeline ran
+        response['degraded'] = degraded
+    
+    for result in ranked_candidates[:top_n]:
+        candidate = result['candidate']
+        response['top_candidates'].append({
+            'full_name': candidate.full_name,
+            'email': candidate.email,
+            'score': round(result['score'], 2),
+            'skill_match_score': round(result['skill_match_score'], 2),
+            'semantic_score': round(result['semantic_score'], 2),
+            'explanations': {
+                'skill_matches': result['explanations']['skill_matches'],
+                'experience_relevance': result['explanations']['experience_relevance']
+            }
+        })
+    return response
@@ -0,0 +1,173 @@
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+SNAPSHOT_DIR = "embedding_snapshots"
+CURRENT_FILE = "CURRENT"
+
+
+def _snapshot_paths(directory: str, version: int) -> Tuple[str, str]:
+    return (
+        os.path.join(directory, f"embeddings_v{version}.npy"),
+        os.path.join(directory, f"ids_v{version}.npy"),
+    )
+
+
+def _read_current(directory: str) -> Optional[int]:
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _atomic_write(path: str, write) -> None:
+    """Write through a temp file and rename, so readers never see a partial file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def export_embedding_snapshot(collection, directory: str = SNAPSHOT_DIR, keep: int = 2) -> int:
+    """
+    Export the candidate embeddings to a new versioned snapshot and publish it
+
+    Rows already in the current version are copied from it; only candidates
+    ingested since are read from ChromaDB. Vectors are stored L2-normalised so
+    readers get cosine similarity from a plain dot product.
+
+    Args:
+        collection: The ChromaDB candidates collection
+        directory: Snapshot directory
+        keep: Number of versions kept on disk, older ones are removed
+    """
+    os.makedirs(directory, exist_ok=True)
+    current = _read_current(directory)
+
+    if current is not None:
+        embeddings_path, ids_path = _snapshot_paths(directory, current)
+        old_embeddings = np.load(embeddings_path, mmap_mode="r")
+        old_ids = np.load(ids_path)
+    else:
+        old_embeddings, old_ids = None, np.empty(0, dtype=np.int64)
+
+    conn = sqlite3.connect('ats.db')
+    all_ids = [row[0] for row in conn.execute("SELECT chroma_index FROM candidate_embeddings ORDER BY chroma_index")]
+    conn.close()
+    new_ids = sorted(set(all_ids) - set(old_ids.tolist()))
+
+    parts, ids = [], [old_ids]
+    if old_embeddings is not None:
+        parts.append(np.asarray(old_embeddings))
+    if new_ids:
+        result = collection.get(ids=[str(i) for i in new_ids], include=["embeddings"])
+        vectors = np.asarray(result["embeddings"], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        parts.append(vectors / np.maximum(norms, 1e-12))
+        ids.append(np.asarray([int(i) for i in result["ids"]], dtype=np.int64))
+
+    if not parts:
+        raise ValueError("No candidate embeddings to export")
+
+    embeddings = np.ascontiguousarray(np.concatenate(parts), dtype=np.float32)
+    ids = np.concatenate(ids)
+
+    version = (current or 0) + 1
+    embeddings_path, ids_path = _snapshot_paths(directory, version)
+    _atomic_write(embeddings_path, lambda f: np.save(f, embeddings))
+    _atomic_write(ids_path, lambda f: np.save(f, ids))
+
+    # Publishing is the rename of CURRENT, readers switch on their next check
+    _atomic_write(os.path.join(directory, CURRENT_FILE), lambda f: f.write(str(version).encode()))
+
+    # Readers still mapping an old version keep their pages until they switch
+    for old_version in range(1, version - keep + 1):
+        for path in _snapshot_paths(directory, old_version):
+            if os.path.exists(path):
+                os.remove(path)
+
+    return version
+
+
+class EmbeddingSnapshot:
+    """
+    Read-only, memory-mapped view of the latest exported embedding snapshot.
+
+    Every worker process maps the same files, so the OS page cache holds a
+    single copy of the vectors. maybe_reload() switches to a newly published
+    version by swapping one tuple, without a restart.
+    """
+    def __init__(self, directory: str = SNAPSHOT_DIR):
+        self.directory = directory
+        self._state = None  # (version, embeddings, positions by chroma index)
+        self._lock = threading.Lock()
+        self.maybe_reload()
+
+    @property
+    def version(self) -> Optional[int]:
+        return self._state[0] if self._state else None
+
+    def maybe_reload(self) -> bool:
+        """Map the published version if it changed, returns True when a switch happened"""
+        version = _read_current(self.directory)
+        if version is None or version == self.version:
+            return False
+
+        with self._lock:
+            if version == self.version:
+                return False
+            embeddings_path, ids_path = _snapshot_paths(self.directory, version)
+            embeddings = np.load(embeddings_path, mmap_mode="r")
+            ids = np.load(ids_path)
+            positions = {int(chroma_index): pos for pos, chroma_index in enumerate(ids)}
+            self._state = (version, embeddings, positions)
+            return True
+
+    def search(self, job_embedding: np.ndarray,
+               candidate_ids: List[int]) -> Tuple[List[Dict[str, Any]], List[int]]:
+        """
+        Exact cosine scores for the given candidates, plus the ids not in the snapshot
+
+        Results use the same convention as EmbeddingManager.search_candidates:
+        'similarity' holds the cosine similarity and the list is sorted nearest first.
+        """
+        if self._state is None:
+            return [], list(candidate_ids)
+
+        _, embeddings, positions = self._state
+        found, missing = [], []
+        for candidate_id in candidate_ids:
+            pos = positions.get(int(candidate_id))
+            if pos is None:
+                missing.append(candidate_id)
+            else:
+                found.append((candidate_id, pos))
+
+        if not found:
+            return [], missing
+
+        query = np.asarray(job_embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        rows = np.fromiter((pos for _, pos in found), dtype=np.int64, count=len(found))
+        scores = embeddings[rows] @ query
+
+        similarities = [{
+            'candidate_id': str(candidate_id),
+            'similarity': float(score),
+            'metadata': {'candidate_id': str(candidate_id)}
+        } for (candidate_id, _), score in zip(found, scores)]
+        similarities.sort(key=lambda s: s['similarity'], reverse=True)
+        return similarities, missing
+
+
+if __name__ == '__main__':
+    from embeddings import EmbeddingManager
+
+    version = export_embedding_snapshot(EmbeddingManager().collection)
+    print(f"Published embedding snapshot v{version} in {SNAPSHOT_DIR}/")
@@ -0,0 +1,194 @@
+import logging
+import time
+import numpy as np
+from typing import List, Dict, Any
+
+# chromadb and sentence_transformers are imported on first use, see EmbeddingManager
+chromadb = None
+Settings = None
+SentenceTransformer = None
+
+# Wall-clock seconds spent in each cold start step, filled in as they happen
+STARTUP_TIMINGS: Dict[str, float] = {}
+
+
+def startup_report() -> Dict[str, float]:
+    """Cold start breakdown: heavy imports, model load and ChromaDB open time"""
+    report = {name: round(seconds, 3) for name, seconds in STARTUP_TIMINGS.items()}
+    report["total"] = round(sum(STARTUP_TIMINGS.values()), 3)
+    return report
+
+
+def build_profile_text(data: Dict[Any, Any]) -> str:
+    """Profile text shared by the embedding and the FTS5 lexical index"""
+    # Format experience text
+    experience_texts = []
+    for exp in data.get('experiences', []):
+        exp_text = f"Worked as {exp['role']} at {exp['company']} for {exp['duration_years']} years"
+        experience_texts.append(exp_text)
+    
+    # Format education text
+    education_texts = []
+    for edu in data.get('education', []):
+        edu_text = f"Studied {edu['degree']} at {edu['institution']} graduating in {edu['year_of_graduation']}"
+        education_texts.append(edu_text)
+    
+    # Combine all text
+    return " ".join([
+        " ".join(experience_texts),
+        " ".join(education_texts),
+        " ".join(data.get('skills', []))
+    ])
+
+
+def _import_backends():
+    """Import chromadb and sentence_transformers on first use, and only once"""
+    global chromadb, Settings, SentenceTransformer
+    if chromadb is not None:
+        return
+
+    start = time.perf_counter()
+    import chromadb
+    from chromadb.config import Settings
+    STARTUP_TIMINGS["import_chromadb"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    from sentence_transformers import SentenceTransformer
+    STARTUP_TIMINGS["import_sentence_transformers"] = time.perf_counter() - start
+
+
+class EmbeddingManager:
+    def __init__(self, hnsw_m: int = 16, hnsw_construction_ef: int = 100, hnsw_search_ef: int = 100):
+        """
+        Args:
+            hnsw_m: HNSW graph degree, only applied when the collection is created
+            hnsw_construction_ef: HNSW build-time candidate list size, only applied on creation
+            hnsw_search_ef: HNSW query-time candidate list size, see set_search_ef
+        """
+        _import_backends()
+
+        print("loading pretrained model")
+        start = time.perf_counter()
+        self.model = SentenceTransformer('models') # sentence-transformers/all-MiniLM-L6-v2 Already downloaded
+        STARTUP_TIMINGS["model_load"] = time.perf_counter() - start
+        
+        # Initialize ChromaDB
+        start = time.perf_counter()
+        self.client = chromadb.PersistentClient(path="./chroma_db", settings=Settings(anonymized_telemetry=False))
+        
+        # Create or get collection. Every add and query passes its own embeddings
+        # from self.model, so the collection needs no embedding function
+        self.collection = self.client.get_or_create_collection(
+            name="candidates",
+            embedding_function=None,
+            configuration={
+                "hnsw": {
+                    "space": "cosine",
+                    "max_neighbors": hnsw_m,
+                    "ef_construction": hnsw_construction_ef,
+                    "ef_search": hnsw_search_ef
+                }
+            }
+        )
+        STARTUP_TIMINGS["chroma_open"] = time.perf_counter() - start
+        if self.search_ef() != hnsw_search_ef:
+            self.set_search_ef(hnsw_search_ef)
+
+    def search_ef(self):
+        """Current HNSW query-time ef of the collection"""
+        return (self.collection.configuration.get("hnsw") or {}).get("ef_search")
+
+    def set_search_ef(self, ef: int):
+        """Tune the HNSW query-time ef of an existing collection (recall vs latency)"""
+        # Only the search-time parameters can change after creation, so the
+        # space and graph settings are left out of the update
+        try:
+            self.collection.modify(configuration={"hnsw": {"ef_search": ef}})
+        except Exception as e:
+            logging.warning(f"Could not update HNSW ef_search to {ef}: {e}")
+    
+    def generate_candidate_embedding(self, data: Dict[Any, Any]) -> np.ndarray:
+        """Generate embedding for candidate profile"""
+        profile_text = build_profile_text(data)
+        
+        # Generate embedding
+        embedding = self.model.encode(profile_text)
+        return embedding.astype(np.float32)
+    
+    def add_candidate(self, candidate_id: str, data: Dict[Any, Any], embedding: np.ndarray):
+        """Add candidate to ChromaDB"""
+        # Format profile text (same as in generate_candidate_embedding)
+        profile_text = build_profile_text(data)
+        
+        # Add to collection
+        self.collection.add(
+            ids=[str(candidate_id)],
+            embeddings=[embedding.tolist()],
+            documents=[profile_text],
+            metadatas=[{
+                "candidate_id": str(candidate_id)
+            }]
+        )
+    
+    def search_candidates(self, 
+                         job_embedding: np.ndarray, 
+                         candidate_ids: List[str], 
+                         k: int = 10) -> List[Dict[str, Any]]:
+        """
+        Search for similar candidates among preselected ones
+        
+        Args:
+            job_embedding: The job embedding vector
+            candidate_ids: List of preselected candidate IDs to search among
+            k: Number of results to return
+        """
+        # Convert candidate_ids to strings if they aren't already
+        candidate_ids = [str(id) for id in candidate_ids]
+        
+        # Query with ID filter
+        results = self.collection.query(
+            query_embeddings=[job_embedding.tolist()],
+            n_results=k,
+            where={"candidate_id": {"$in": candidate_ids}}
+        )
+        
+        # Process results
+        similarities = []
+        for idx, id in enumerate(results['ids'][0]):
+            similarities.append({
+                'candidate_id': id,
+                # The collection uses cosine distance, scores use cosine similarity
+                'similarity': 1.0 - results['distances'][0][idx],
+                'metadata': results['metadatas'][0][idx]
+            })
+        
+        return similarities
+
+    def nearest_candidates(self, job_embedding: np.ndarray, k: int = 200) -> List[Dict[str, Any]]:
+        """
+        Query the HNSW index directly for the k nearest candidate profiles,
+        without an id filter, so the cost does not grow with the candidate pool
+
+        Args:
+            job_embedding: The job embedding vector
+            k: Number of nearest profiles to return
+        """
+        k = min(k, self.collection.count())
+        if k <= 0:
+            return []
+
+        results = self.collection.query(
+            query_embeddings=[job_embedding.tolist()],
+            n_results=k
+        )
+
+        similarities = []
+        for idx, id in enumerate(results['ids'][0]):
+            similarities.append({
+                'candidate_id': id,
+                # The collection uses cosine distance, scores use cosine similarity
+                'similarity': 1.0 - results['distances'][0][idx],
+                'metadata': results['metadatas'][0][idx]
+            })
+
+        return similarities
@@ -1,79 +1,312 @@
+'''Load-test harness for the ATS HTTP API.
+
+Sends open-loop traffic (Poisson arrivals at a fixed rate, independent of how
+fast the server answers) to /api/match-candidates and /api/candidates, and
+writes a machine-readable JSON report with throughput, latency percentiles,
+error rates and the server-reported stage timings.
+
+    python main.py --rate 5 --duration 60 --warmup 10 --ingest-fraction 0.1 --report report.json
+    python main.py --once     # single match request, printed like the original demo
+'''
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
 import requests
 
-def test_ats_matching():
-    # API endpoint
-    url = "http://localhost:5000/api/match-candidates"
-    
-    job_data = {
-    "job_title": "Software Engineer",
-    "job_description": "Responsible for developing and maintaining software applications.",
-    "budget": {
-        "min": 70000,
-        "max": 90000,
-        "currency": "USD"
+DEFAULT_JOB_TEMPLATES = [
+    {
+        "weight": 3,
+        "job_title": "Software Engineer",
+        "job_description": "Responsible for developing and maintaining software applications.",
+        "budget": {"min": 70000, "max": 90000, "currency": "USD"},
+        "required_skills": ["JavaScript", "Python", "Java"]
+    },
+    {
+        "weight": 2,
+        "job_title": "Data Scientist",
+        "job_description": "Build machine learning models and analyse large datasets.",
+        "budget": {"min": 80000, "max": 110000, "currency": "USD"},
+        "required_skills": ["Python", "Machine Learning", "SQL"],
+        "constraints": {"min_years_experience": 3}
+    },
+    {
+        "weight": 1,
+        "job_title": "Math Teacher",
+        "job_description": "Teach algebra and geometry to secondary school students.",
+        "budget": {"min": 40000, "max": 55000, "currency": "USD"},
+        "required_skills": ["Mathematics", "Teaching"]
     },
-    "required_skills": ["JavaScript", "Python", "Java"]
+    {
+        "weight": 1,
+        "job_title": "Pediatrician",
+        "job_description": "Provide medical care to children in a clinic setting.",
+        "budget": {"min": 120000, "max": 180000, "currency": "USD"},
+        "required_skills": ["Medicine", "Pediatrics"],
+        "retrieval_mode": "ann"
+    },
+]
+
+INGEST_SKILLS = ["Python", "Java", "Javascript", "SQL", "Machine Learning", "Teaching",
+                 "Mathematics", "Medicine", "Statistics", "React", "Pytorch"]
+INGEST_ROLES = ["Software Engineer", "Data Scientist", "Math Teacher", "Data Analyst",
+                "Backend Developer", "Resident Doctor"]
+
+
+def synthetic_candidate(rng: random.Random) -> Dict[str, Any]:
+    """A unique candidate for ingest traffic, drawn from rng so a seeded run is reproducible"""
+    suffix = f"{rng.getrandbits(40):010x}"
+    start_year = rng.randint(2005, 2020)
+    return {
+        "first_name": "Load",
+        "last_name": f"Test {suffix}",
+        "birthdate": "1990-01-01",
+        "age": 34,
+        "email": f"loadtest.{suffix}@example.com",
+        "phone": "+10000000000",
+        "address": "1 Benchmark Way",
+        "skills": rng.sample(INGEST_SKILLS, 3),
+        "experiences": [
+            {"company": "Load Corp", "role": rng.choice(INGEST_ROLES),
+             "start_date": f"{start_year}-01-01", "end_date": None}
+        ],
+        "education": [
+            {"institution": "Bench University", "degree": "Bachelor", "year_of_graduation": start_year}
+        ]
     }
 
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile, rounded to microseconds when values are in ms"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    # Multiplying first keeps pct * n exact, 7 / 100 * 100 would round up to rank 8
+    rank = max(1, math.ceil(pct * len(ordered) / 100))
+    return round(ordered[min(rank, len(ordered)) - 1], 3)
+
+
+class LoadTest:
+    def __init__(self, match_url: str, ingest_url: str, job_templates: List[Dict[str, Any]],
+                 rate: float, duration: float, warmup: float, ingest_fraction: float,
+                 timeout: float, max_in_flight: int, seed: Optional[int] = None):
+        self.match_url = match_url
+        self.ingest_url = ingest_url
+        self.job_templates = job_templates
+        self.job_weights = [t.get("weight", 1) for t in job_templates]
+        self.rate = rate
+        self.duration = duration
+        self.warmup = warmup
+        self.ingest_fraction = ingest_fraction
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.random = random.Random(seed)
+
+        self.results: List[Dict[str, Any]] = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _send(self, kind: str, template: Optional[str], payload: Dict[str, Any],
+              scheduled_at: float, phase: str):
+        url = self.match_url if kind == "match" else self.ingest_url
+        result = {"kind": kind, "template": template, "phase": phase}
+        try:
+            response = self._session().post(url, json=payload, timeout=self.timeout)
+            result["status"] = response.status_code
+            if kind == "match" and response.ok:
+                result["stage_timings"] = response.json().get("stage_timings", {})
+        except requests.exceptions.RequestException as e:
+            result["status"] = None
+            result["error"] = type(e).__name__
+
+        # Measured from the scheduled arrival, so client-side queueing is not hidden
+        result["latency_ms"] = (time.perf_counter() - scheduled_at) * 1000
+        with self._lock:
+            self.results.append(result)
+
+    def run(self) -> Dict[str, Any]:
+        total = self.warmup + self.duration
+        in_flight = threading.BoundedSemaphore(self.max_in_flight)
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            start = time.perf_counter()
+            next_arrival = start
+            while next_arrival - start < total:
+                delay = next_arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+                phase = "warmup" if next_arrival - start < self.warmup else "measure"
+                if self.random.random() < self.ingest_fraction:
+                    kind, template, payload = "ingest", None, synthetic_candidate(self.random)
+                else:
+                    job = self.random.choices(self.job_templates, weights=self.job_weights)[0]
+                    payload = {k: v for k, v in job.items() if k != "weight"}
+                    kind, template = "match", job["job_title"]
+
+                # Open loop - arrivals never wait for responses. Past max_in_flight
+                # the arrival is counted as dropped instead of delaying the schedule
+                if in_flight.acquire(blocking=False):
+                    future = pool.submit(self._send, kind, template, payload, next_arrival, phase)
+                    future.add_done_callback(lambda _: in_flight.release())
+                elif phase == "measure":
+                    with self._lock:
+                        self.dropped += 1
+
+                next_arrival += self.random.expovariate(self.rate)
+
+        return self.report()
+
+    def _summary(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        latencies = [r["latency_ms"] for r in results]
+        ok = [r for r in results if r["status"] is not None and 200 <= r["status"] < 300]
+        status_counts: Dict[str, int] = {}
+        for r in results:
+            key = str(r["status"]) if r["status"] is not None else r.get("error", "error")
+            status_counts[key] = status_counts.get(key, 0) + 1
+
+        stages: Dict[str, List[float]] = {}
+        for r in ok:
+            for stage, ms in (r.get("stage_timings") or {}).items():
+                stages.setdefault(stage, []).append(ms)
+
+        return {
+            "requests": len(results),
+            "throughput_rps": round(len(ok) / self.duration, 3) if self.duration else None,
+            "error_rate": round(1 - len(ok) / len(results), 4) if results else None,
+            "status_counts": status_counts,
+            "latency_ms": {
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "max": round(max(latencies), 3) if latencies else None,
+            },
+            "stage_timings_ms": {
+                stage: {
+                    "mean": round(sum(values) / len(values), 3),
+                    "p95": percentile(values, 95),
+                } for stage, values in stages.items()
+            },
+        }
+
+    def report(self) -> Dict[str, Any]:
+        measured = [r for r in self.results if r["phase"] == "measure"]
+        by_kind = {kind: self._summary([r for r in measured if r["kind"] == kind])
+                   for kind in ("match", "ingest")}
+        templates = sorted({r["template"] for r in measured if r["kind"] == "match"})
+        return {
+            "config": {
+                "match_url": self.match_url,
+                "ingest_url": self.ingest_url,
+                "rate_rps": self.rate,
+                "duration_s": self.duration,
+                "warmup_s": self.warmup,
+                "ingest_fraction": self.ingest_fraction,
+                "max_in_flight": self.max_in_flight,
+            },
+            "dropped_arrivals": self.dropped,
+            "overall": self._summary(measured),
+            "by_kind": by_kind,
+            "by_template": {t: self._summary([r for r in measured if r["template"] == t]) for t in templates},
+        }
+
+
+def test_ats_matching(url: str, job_data: Dict[str, Any]):
+    """Single match request, printed for a quick manual check"""
     try:
         # Send POST request
         print("Sending request to ATS system...")
-        response = requests.post(
-            url,
-            json=job_data,
-            headers={'Content-Type': 'application/json'}
-        )
-        
+        response = requests.post(url, json=job_data, headers={'Content-Type': 'application/json'})
+
         # Check if request was successful
         response.raise_for_status()
-        
-        # Get response data
         result = response.json()
-        
+
         # Print job ID and execution time
         print("\nJob Match Results:")
         print(f"Job ID: {result['job_id']}")
         print(f"Execution Time: {result['execution_time']:.2f} seconds")
-        
+
         # Print top candidates
-        print("\nTop 5 Candidates:")
+        print("\nTop Candidates:")
         print("-" * 50)
-        
+
         for i, candidate in enumerate(result['top_candidates'], 1):
             print(f"\n{i}. {candidate['full_name']}")
             print(f"   Email: {candidate['email']}")
             print(f"   Total Score: {candidate['score']}")
             print(f"   Skill Match: {candidate['skill_match_score']}")
             print(f"   Semantic Match: {candidate['semantic_score']}")
-            
+
             print("\n   Matching Skills:")
             for skill in candidate['explanations']['skill_matches']:
                 print(f"   - {skill}")
-            
+
             print("\n   Experience Relevance:")
             for exp in candidate['explanations']['experience_relevance']:
                 print(f"   - {exp}")
-            
+
             print("-" * 50)
-        
-        # # Now get detailed matches using the job_id
-        # detailed_url = f"http://localhost:5000/api/job-matches/{result['job_id']}"
-        # detailed_response = requests.get(detailed_url)
-        # detailed_response.raise_for_status()
-        
-        # Save detailed results to a file
-        # with open(f"job_matches_{result['job_id']}.json", 'w') as f:
-        #     json.dump(detailed_response.json(), f, indent=2)
-        
-        # print(f"\nDetailed results saved to job_matches_{result['job_id']}.json")
-        
+
     except requests.exceptions.RequestException as e:
         print(f"Error making request: {e}")
         if hasattr(e.response, 'text'):
             print(f"Server response: {e.response.text}")
-    except Exception as e:
-        print(f"Unexpected error: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-loop load test for the ATS API")
+    parser.add_argument("--base-url", default="http://localhost:5000", help="Server serving /api/match-candidates")
+    parser.add_argument("--ingest-base-url", default=None, help="Server serving /api/candidates (defaults to --base-url)")
+    parser.add_argument("--rate", type=float, default=2.0, help="Mean arrival rate, requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured phase length, seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Warm-up phase length, seconds (not reported)")
+    parser.add_argument("--ingest-fraction", type=float, default=0.0, help="Share of arrivals that are ingest requests")
+    parser.add_argument("--jobs", default=None, help="JSON file with a list of job templates, each with an optional 'weight'")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Client timeout per request, seconds")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="Client-side concurrency cap")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed for arrivals, job mix and ingest payloads; rerunning a seed "
+                             "against the same database repeats candidate emails")
+    parser.add_argument("--report", default=None, help="Write the JSON report here instead of stdout")
+    parser.add_argument("--once", action="store_true", help="Send a single match request and print it")
+    args = parser.parse_args()
+
+    match_url = f"{args.base_url}/api/match-candidates"
+    ingest_url = f"{args.ingest_base_url or args.base_url}/api/candidates"
+
+    job_templates = DEFAULT_JOB_TEMPLATES
+    if args.jobs:
+        with open(args.jobs) as f:
+            job_templates = json.load(f)
+
+    if args.once:
+        test_ats_matching(match_url, {k: v for k, v in job_templates[0].items() if k != "weight"})
+        return
+
+    load_test = LoadTest(match_url, ingest_url, job_templates, args.rate, args.duration,
+                         args.warmup, args.ingest_fraction, args.timeout, args.max_in_flight, args.seed)
+    report = json.dumps(load_test.run(), indent=2)
+
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(report)
+        print(f"Report written to {args.report}")
+    else:
+        print(report)
+
 
 if __name__ == "__main__":
-    # Run the test
-    test_ats_matching()
\ No newline at end of file
+    main()
@@ -0,0 +1,196 @@
+'''Retention and compaction for the job_matches analytics table.
+
+Old match rows are rolled up into one job_match_summaries row per job (score
+distribution and top candidate emails), then deleted in small batches, each in
+its own short transaction, so matches being stored are never blocked for long.
+Freed pages are returned to the OS with incremental vacuum.
+
+    python retention.py --max-age-days 30 --max-jobs 1000
+    python retention.py --enable-incremental-vacuum   # one-time, full VACUUM
+'''
+
+import argparse
+import json
+import logging
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from storage import init_db
+
+logging.basicConfig(level=logging.INFO)
+
+
+@dataclass
+class RetentionPolicy:
+    max_age_days: Optional[float] = 30   # Compact jobs whose last match is older than this
+    max_jobs: Optional[int] = 1000       # Keep detail rows only for the most recent jobs
+    top_n: int = 10                      # Candidate emails kept per summary
+    batch_size: int = 500                # Rows deleted per transaction
+    pause_seconds: float = 0.01          # Gap between batches, lets writers in
+    vacuum_pages: int = 1000             # Pages released per incremental vacuum step
+
+
+def _connect() -> sqlite3.Connection:
+    # Wait for concurrent writers instead of failing with "database is locked"
+    return sqlite3.connect('ats.db', timeout=30)
+
+
+def _percentile(ordered: List[float], pct: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def jobs_to_compact(conn: sqlite3.Connection, policy: RetentionPolicy) -> List[str]:
+    """Job ids whose detail rows fall outside the age or count policy"""
+    job_ids = set()
+
+    if policy.max_age_days is not None:
+        rows = conn.execute('''
+            SELECT job_id FROM job_matches
+            GROUP BY job_id
+            HAVING MAX(timestamp) < datetime('now', ?)
+        ''', (f"-{policy.max_age_days} days",)).fetchall()
+        job_ids.update(row[0] for row in rows)
+
+    if policy.max_jobs is not None:
+        rows = conn.execute('''
+            SELECT job_id FROM job_matches
+            GROUP BY job_id
+            ORDER BY MAX(timestamp) DESC, MAX(id) DESC
+            LIMIT -1 OFFSET ?
+        ''', (policy.max_jobs,)).fetchall()
+        job_ids.update(row[0] for row in rows)
+
+    return sorted(job_ids)
+
+
+def summarize_job(conn: sqlite3.Connection, job_id: str, top_n: int) -> bool:
+    """Write the summary row of a job, returns False when there is nothing to summarize"""
+    rows = conn.execute('''
+        SELECT timestamp, job_title, required_skills, budget_min, budget_max,
+               budget_currency, execution_time, candidate_email, total_score
+        FROM job_matches
+        WHERE job_id = ?
+        ORDER BY total_score DESC
+    ''', (job_id,)).fetchall()
+    if not rows:
+        return False
+
+    scores = sorted(row[8] for row in rows)
+    timestamps = [row[0] for row in rows]
+    first = rows[0]
+    conn.execute('''
+        INSERT INTO job_match_summaries (
+            job_id, first_timestamp, last_timestamp, job_title, required_skills,
+            budget_min, budget_max, budget_currency, execution_time, match_count,
+            score_min, score_p50, score_p90, score_max, score_mean, top_candidates
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        job_id,
+        min(timestamps),
+        max(timestamps),
+        first[1],
+        first[2],
+        first[3],
+        first[4],
+        first[5],
+        first[6],
+        len(rows),
+        scores[0],
+        _percentile(scores, 50),
+        _percentile(scores, 90),
+        scores[-1],
+        sum(scores) / len(scores),
+        json.dumps([row[7] for row in rows[:top_n]])
+    ))
+    return True
+
+
+def compact_job(conn: sqlite3.Connection, job_id: str, policy: RetentionPolicy) -> int:
+    """Summarize one job and delete its detail rows in batches, returns rows deleted"""
+    # An existing summary means an earlier run was interrupted while deleting;
+    # the remaining rows are already counted in it, so only the deletion resumes
+    already_summarized = conn.execute(
+        "SELECT 1 FROM job_match_summaries WHERE job_id = ?", (job_id,)).fetchone()
+    if not already_summarized:
+        with conn:
+            summarize_job(conn, job_id, policy.top_n)
+
+    deleted = 0
+    while True:
+        with conn:
+            cursor = conn.execute('''
+                DELETE FROM job_matches
+                WHERE id IN (SELECT id FROM job_matches WHERE job_id = ? LIMIT ?)
+            ''', (job_id, policy.batch_size))
+        deleted += cursor.rowcount
+        if cursor.rowcount < policy.batch_size:
+            return deleted
+        time.sleep(policy.pause_seconds)
+
+
+def incremental_vacuum(conn: sqlite3.Connection, pages: int) -> int:
+    """Release up to pages free pages, returns how many were free before"""
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if auto_vacuum != 2:
+        logging.warning("auto_vacuum is not INCREMENTAL, run with --enable-incremental-vacuum once")
+        return free_pages
+    # executescript steps the pragma to completion, execute() would free a single page
+    conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+    return free_pages
+
+
+def enable_incremental_vacuum(conn: sqlite3.Connection):
+    """Switch an existing database to incremental auto-vacuum (one full VACUUM)"""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+
+
+def run_retention(policy: RetentionPolicy) -> Dict[str, Any]:
+    """Apply the policy to job_matches, returns counts for logging"""
+    init_db()
+    conn = _connect()
+    try:
+        job_ids = jobs_to_compact(conn, policy)
+        deleted = 0
+        for job_id in job_ids:
+            deleted += compact_job(conn, job_id, policy)
+            time.sleep(policy.pause_seconds)
+
+        free_pages = incremental_vacuum(conn, policy.vacuum_pages)
+        result = {"jobs_compacted": len(job_ids), "rows_deleted": deleted, "free_pages_before_vacuum": free_pages}
+        logging.info(f"Retention: {result}")
+        return result
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compact old job_matches rows into per-job summaries")
+    parser.add_argument("--max-age-days", type=float, default=30)
+    parser.add_argument("--max-jobs", type=int, default=1000)
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--vacuum-pages", type=int, default=1000)
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="Switch the database to incremental auto-vacuum (one full VACUUM) and exit")
+    args = parser.parse_args()
+
+    if args.enable_incremental_vacuum:
+        conn = _connect()
+        enable_incremental_vacuum(conn)
+        conn.close()
+    else:
+        run_retention(RetentionPolicy(
+            max_age_days=args.max_age_days,
+            max_jobs=args.max_jobs,
+            top_n=args.top_n,
+            batch_size=args.batch_size,
+            vacuum_pages=args.vacuum_pages,
+        ))
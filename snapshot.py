@@ -0,0 +1,213 @@
+import json
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+from storage import EDUCATION_LEVELS
+
+
+@dataclass(frozen=True)
+class SnapshotColumns:
+    """One immutable generation of the snapshot, swapped as a whole on refresh"""
+    ids: np.ndarray              # int64, candidate ids in ascending order
+    chroma_index: np.ndarray     # int64, embedding row of each candidate
+    closed_years: np.ndarray     # float32, years in closed roles, NaN when unknown
+    ongoing_start: np.ndarray    # int32, proleptic ordinal of the ongoing role start, 0 when none
+    education_rank: np.ndarray   # int8, -1 when unknown
+    last_role_end: np.ndarray    # int32 as YYYYMMDD, 0 when the candidate has no experience
+    expected_salary: np.ndarray  # float32, NaN when not given
+    skill_offsets: np.ndarray    # int64, CSR offsets into skill_ids, len(ids) + 1
+    skill_ids: np.ndarray        # int32, lowercased skill ids, see CandidateSnapshot.skill_vocab
+    pos_by_chroma: Dict[int, int]  # embedding row -> position in these columns
+    vocab_size: int              # skill ids below this are the only ones used in skill_ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def _empty_columns() -> SnapshotColumns:
+    return SnapshotColumns(
+        ids=np.empty(0, dtype=np.int64),
+        chroma_index=np.empty(0, dtype=np.int64),
+        closed_years=np.empty(0, dtype=np.float32),
+        ongoing_start=np.empty(0, dtype=np.int32),
+        education_rank=np.empty(0, dtype=np.int8),
+        last_role_end=np.empty(0, dtype=np.int32),
+        expected_salary=np.empty(0, dtype=np.float32),
+        skill_offsets=np.zeros(1, dtype=np.int64),
+        skill_ids=np.empty(0, dtype=np.int32),
+        pos_by_chroma={},
+        vocab_size=0,
+    )
+
+
+def _as_float(value) -> float:
+    """A stored REAL value, NaN when missing or not numeric (rows ingested before validation)"""
+    if value is None:
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _ordinal(value: str) -> int:
+    """YYYY-MM-DD as a day number, 0 for missing dates"""
+    return date.fromisoformat(value).toordinal() if value else 0
+
+
+def _date_key(value: str) -> int:
+    """YYYY-MM-DD as a comparable int, 0 for missing dates"""
+    return int(value.replace("-", "")) if value else 0
+
+
+class CandidateSnapshot:
+    """
+    In-process columnar copy of the scoring-relevant candidate fields.
+
+    Only ids, skill ids, derived constraint columns and the embedding row are
+    kept; names, contact details and the experience/education JSON stay in
+    SQLite and are hydrated for the final results only. Candidates are
+    insert-only and ids come from AUTOINCREMENT, so the id doubles as the
+    update sequence and refresh() only reads rows above the last one seen.
+    """
+    def __init__(self):
+        self.columns = _empty_columns()
+        self.skill_vocab: Dict[str, int] = {}
+        self.last_seq = 0
+        self._lock = threading.Lock()
+
+    def refresh(self) -> int:
+        """Append candidates ingested since the last refresh, returns how many were added"""
+        with self._lock:
+            conn = sqlite3.connect('ats.db')
+            rows = conn.execute('''
+                SELECT c.id, ce.chroma_index, c.skills, c.closed_experience_years, c.ongoing_role_start,
+                       c.education_rank, c.last_role_end, c.expected_salary
+                FROM candidates c
+                JOIN candidate_embeddings ce ON c.id = ce.candidate_id
+                WHERE c.id > ?
+                ORDER BY c.id
+            ''', (self.last_seq,)).fetchall()
+            conn.close()
+
+            if not rows:
+                return 0
+
+            old = self.columns
+            ids, chroma_index, closed_years, ongoing_start, education_rank = [], [], [], [], []
+            last_role_end, expected_salary, skill_counts, skill_ids = [], [], [], []
+            for candidate_id, chroma, skills, years, role_start, rank, role_end, salary in rows:
+                ids.append(candidate_id)
+                chroma_index.append(chroma)
+                closed_years.append(_as_float(years))
+                ongoing_start.append(_ordinal(role_start))
+                education_rank.append(-1 if rank is None else rank)
+                last_role_end.append(_date_key(role_end))
+                expected_salary.append(_as_float(salary))
+
+                candidate_skills = {s.lower() for s in json.loads(skills or '[]')}
+                for skill in candidate_skills:
+                    skill_ids.append(self.skill_vocab.setdefault(skill, len(self.skill_vocab)))
+                skill_counts.append(len(candidate_skills))
+
+            new_offsets = old.skill_offsets[-1] + np.cumsum(skill_counts, dtype=np.int64)
+            # Copied, so a generation already captured by a match never sees the new positions
+            pos_by_chroma = dict(old.pos_by_chroma)
+            for pos, chroma in enumerate(chroma_index, len(old)):
+                pos_by_chroma[int(chroma)] = pos
+            columns = SnapshotColumns(
+                ids=np.concatenate([old.ids, np.asarray(ids, dtype=np.int64)]),
+                chroma_index=np.concatenate([old.chroma_index, np.asarray(chroma_index, dtype=np.int64)]),
+                closed_years=np.concatenate([old.closed_years, np.asarray(closed_years, dtype=np.float32)]),
+                ongoing_start=np.concatenate([old.ongoing_start, np.asarray(ongoing_start, dtype=np.int32)]),
+                education_rank=np.concatenate([old.education_rank, np.asarray(education_rank, dtype=np.int8)]),
+                last_role_end=np.concatenate([old.last_role_end, np.asarray(last_role_end, dtype=np.int32)]),
+                expected_salary=np.concatenate([old.expected_salary, np.asarray(expected_salary, dtype=np.float32)]),
+                skill_offsets=np.concatenate([old.skill_offsets, new_offsets]),
+                skill_ids=np.concatenate([old.skill_ids, np.asarray(skill_ids, dtype=np.int32)]),
+                pos_by_chroma=pos_by_chroma,
+                vocab_size=len(self.skill_vocab),
+            )
+            self.columns = columns
+            self.last_seq = ids[-1]
+            return len(rows)
+
+    def positions_for_chroma(self, chroma_indices: Iterable[int], columns: SnapshotColumns = None) -> np.ndarray:
+        """Snapshot positions of the given embedding rows, unknown rows are dropped"""
+        columns = self.columns if columns is None else columns
+        positions = [columns.pos_by_chroma.get(int(i)) for i in chroma_indices]
+        return np.asarray([p for p in positions if p is not None], dtype=np.int64)
+
+    def positions_for_ids(self, candidate_ids: Iterable[int], columns: SnapshotColumns = None) -> np.ndarray:
+        """Snapshot positions of the given candidate ids, unknown ids are dropped"""
+        columns = self.columns if columns is None else columns
+        ids = columns.ids
+        wanted = np.asarray(list(candidate_ids), dtype=np.int64)
+        positions = np.searchsorted(ids, wanted)
+        found = positions < len(ids)
+        found[found] = ids[positions[found]] == wanted[found]
+        return positions[found]
+
+    def skill_counts(self, skills: Iterable[str], columns: SnapshotColumns = None) -> np.ndarray:
+        """Number of the given skills each candidate has, case-insensitive"""
+        columns = self.columns if columns is None else columns
+        # Sized from the generation, a concurrent refresh may add skills to the live
+        # vocab; ids are never reassigned, so newer ones are simply not in these columns
+        wanted = np.zeros(columns.vocab_size + 1, dtype=np.int32)
+        for skill in {s.lower() for s in skills}:
+            skill_id = self.skill_vocab.get(skill)
+            if skill_id is not None and skill_id < columns.vocab_size:
+                wanted[skill_id] = 1
+
+        # Prefix sums over the CSR rows give every candidate's count in one pass
+        hits = np.concatenate([[0], np.cumsum(wanted[columns.skill_ids], dtype=np.int64)])
+        return hits[columns.skill_offsets[1:]] - hits[columns.skill_offsets[:-1]]
+
+    def constraint_mask(self, constraints: Dict[str, Any], budget: Dict[str, Any] = None,
+                        columns: SnapshotColumns = None) -> np.ndarray:
+        """Same semantics as ATSSystem._constraint_conditions, evaluated on the columns"""
+        columns = self.columns if columns is None else columns
+        mask = np.ones(len(columns), dtype=bool)
+        constraints = constraints or {}
+
+        if constraints.get("min_years_experience") is not None:
+            # Time in the ongoing role keeps growing after ingest, so it is added here
+            elapsed_days = np.where(columns.ongoing_start > 0, date.today().toordinal() - columns.ongoing_start, 0)
+            mask &= columns.closed_years + elapsed_days / 365 >= float(constraints["min_years_experience"])
+
+        if constraints.get("min_education_level") is not None:
+            mask &= columns.education_rank >= EDUCATION_LEVELS.index(constraints["min_education_level"])
+
+        if constraints.get("max_years_since_last_role") is not None:
+            cutoff = datetime.now() - timedelta(days=365 * float(constraints["max_years_since_last_role"]))
+            mask &= columns.last_role_end >= _date_key(cutoff.strftime("%Y-%m-%d"))
+
+        if constraints.get("within_budget") and budget and budget.get("max") is not None:
+            salary = columns.expected_salary
+            mask &= np.isnan(salary) | (salary <= float(budget["max"]))
+
+        return mask
+
+
+def hydrate_candidates(candidate_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Load the profile fields needed to present the given candidates, keyed by id"""
+    if not candidate_ids:
+        return {}
+
+    conn = sqlite3.connect('ats.db')
+    c = conn.cursor()
+    placeholders = ', '.join('?' for _ in candidate_ids)
+    c.execute(f'''
+        SELECT id, first_name, last_name, email, skills, experiences, education
+        FROM candidates
+        WHERE id IN ({placeholders})
+    ''', [int(i) for i in candidate_ids])
+    column_names = [description[0] for description in c.description]
+    rows = {row[0]: dict(zip(column_names, row)) for row in c.fetchall()}
+    conn.close()
+    return rows
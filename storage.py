@@ -0,0 +1,420 @@
+import sqlite3
+import json
+import time
+import uuid
+from datetime import datetime
+from typing import List, Dict, Any
+from embeddings import build_profile_text
+
+
+EDUCATION_LEVELS = ["High School", "Bachelor", "Master", "PhD"]
+
+# Sentinel end date for ongoing roles, sorts after any real date so recency
+# filters stay a plain indexed range comparison
+ONGOING_ROLE_END = "9999-12-31"
+
+# Derived columns used by the structured pre-filter, computed at ingest
+# Experience is split in closed-role years and the start of the ongoing role,
+# the elapsed time of the ongoing role is added when a match runs
+DERIVED_CANDIDATE_COLUMNS = {
+    "closed_experience_years": "REAL",
+    "ongoing_role_start": "DATE",
+    "education_rank": "INTEGER",
+    "last_role_end": "DATE",
+    "expected_salary": "REAL",
+}
+
+def init_db():
+    conn = sqlite3.connect('ats.db')
+    c = conn.cursor()
+
+    # Only takes effect on a new, empty database; existing ones are switched
+    # over once by retention.enable_incremental_vacuum
+    c.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    
+    # Create tables if they don't already exist
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS candidates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            first_name TEXT NOT NULL,
+            last_name TEXT NOT NULL,
+            birthdate DATE,
+            age INTEGER,
+            email TEXT UNIQUE NOT NULL,
+            phone TEXT,
+            address TEXT,
+            skills TEXT,
+            max_education_level TEXT,
+            experiences JSON,  -- Add JSON column for experiences
+            education JSON,    -- Add JSON column for education
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            -- Derived columns for the structured pre-filter
+            closed_experience_years REAL,
+            ongoing_role_start DATE,
+            education_rank INTEGER,
+            last_role_end DATE,
+            expected_salary REAL
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS experiences (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            candidate_id INTEGER NOT NULL,
+            company TEXT NOT NULL,
+            role TEXT NOT NULL,
+            start_date DATE NOT NULL,
+            end_date DATE,
+            duration_years REAL,
+            FOREIGN KEY (candidate_id) REFERENCES candidates (id)
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS education (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            candidate_id INTEGER NOT NULL,
+            institution TEXT NOT NULL,
+            degree TEXT NOT NULL,
+            year_of_graduation INTEGER NOT NULL,
+            FOREIGN KEY (candidate_id) REFERENCES candidates (id)
+        )
+    ''')
+
+    # Chroma index mapping
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS candidate_embeddings (
+            candidate_id INTEGER PRIMARY KEY,
+            chroma_index INTEGER NOT NULL,
+            embedding_updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (candidate_id) REFERENCES candidates (id)
+        )
+    ''')
+
+        
+    # Result job matches table - Metrics also
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS job_matches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            execution_time FLOAT,
+            
+            -- Job details
+            job_title TEXT NOT NULL,
+            job_description TEXT,
+            budget_min FLOAT,
+            budget_max FLOAT,
+            budget_currency TEXT,
+            required_skills TEXT,
+            
+            -- Candidate details
+            candidate_name TEXT NOT NULL,
+            candidate_email TEXT NOT NULL,
+            
+            -- Match scores
+            total_score FLOAT NOT NULL,
+            skill_match_score FLOAT NOT NULL,
+            semantic_score FLOAT NOT NULL,
+            
+            -- Match explanations
+            skill_matches TEXT,
+            experience_relevance TEXT,
+            
+            FOREIGN KEY (candidate_email) REFERENCES candidate_email
+        )
+    ''')
+    
+    # Lexical index over the profile text, rowid is the candidate id
+    c.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS candidate_profiles_fts USING fts5(
+            profile_text,
+            tokenize = 'porter unicode61'
+        )
+    ''')
+
+    # Compact per-job rollups of job_matches rows removed by retention.py
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS job_match_summaries (
+            job_id TEXT PRIMARY KEY,
+            first_timestamp TIMESTAMP,
+            last_timestamp TIMESTAMP,
+            job_title TEXT NOT NULL,
+            required_skills TEXT,
+            budget_min FLOAT,
+            budget_max FLOAT,
+            budget_currency TEXT,
+            execution_time FLOAT,
+            match_count INTEGER NOT NULL,
+
+            -- Score distribution
+            score_min FLOAT,
+            score_p50 FLOAT,
+            score_p90 FLOAT,
+            score_max FLOAT,
+            score_mean FLOAT,
+
+            -- JSON list of the top candidate emails, best first
+            top_candidates TEXT,
+            compacted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_job_matches_job_id ON job_matches (job_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_job_matches_timestamp ON job_matches (timestamp)")
+
+    migrate_derived_columns(conn)
+    migrate_profile_index(conn)
+
+    conn.commit()
+    conn.close()
+
+
+def derive_candidate_columns(experiences: List[Dict[str, Any]], max_education_level: str) -> Dict[str, Any]:
+    """Compute the pre-filter columns from an enriched candidate profile"""
+    # Ongoing durations were measured on the ingest day and would go stale.
+    # Concurrent ongoing roles count once, from the earliest start
+    closed_years = sum(exp.get('duration_years') or 0 for exp in experiences if exp.get('end_date'))
+    ongoing_starts = [exp['start_date'] for exp in experiences if not exp.get('end_date')]
+    last_role_end = None
+    for exp in experiences:
+        end_date = exp.get('end_date') or ONGOING_ROLE_END
+        if last_role_end is None or end_date > last_role_end:
+            last_role_end = end_date
+
+    education_rank = EDUCATION_LEVELS.index(max_education_level) if max_education_level in EDUCATION_LEVELS else 0
+    return {
+        "closed_experience_years": round(closed_years, 1),
+        "ongoing_role_start": min(ongoing_starts) if ongoing_starts else None,
+        "education_rank": education_rank,
+        "last_role_end": last_role_end,
+    }
+
+
+def migrate_derived_columns(conn):
+    """Add and backfill the derived pre-filter columns on databases created before them"""
+    c = conn.cursor()
+    existing = {row[1] for row in c.execute("PRAGMA table_info(candidates)")}
+    missing = [name for name in DERIVED_CANDIDATE_COLUMNS if name not in existing]
+    for name in missing:
+        c.execute(f"ALTER TABLE candidates ADD COLUMN {name} {DERIVED_CANDIDATE_COLUMNS[name]}")
+
+    if missing:
+        rows = c.execute("SELECT id, experiences, max_education_level FROM candidates").fetchall()
+        for candidate_id, experiences, max_education_level in rows:
+            derived = derive_candidate_columns(json.loads(experiences or '[]'), max_education_level)
+            c.execute('''
+                UPDATE candidates
+                SET closed_experience_years = ?, ongoing_role_start = ?, education_rank = ?, last_role_end = ?
+                WHERE id = ?
+            ''', (derived['closed_experience_years'], derived['ongoing_role_start'],
+                  derived['education_rank'], derived['last_role_end'], candidate_id))
+
+    c.execute("CREATE INDEX IF NOT EXISTS idx_candidates_education_rank ON candidates (education_rank)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_candidates_last_role_end ON candidates (last_role_end)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_candidates_expected_salary ON candidates (expected_salary)")
+
+
+
+
+def migrate_profile_index(conn):
+    """Index candidates that were ingested before the FTS5 table existed"""
+    c = conn.cursor()
+    rows = c.execute('''
+        SELECT id, skills, experiences, education
+        FROM candidates
+        WHERE id NOT IN (SELECT rowid FROM candidate_profiles_fts)
+    ''').fetchall()
+    for candidate_id, skills, experiences, education in rows:
+        profile_text = build_profile_text({
+            'skills': json.loads(skills or '[]'),
+            'experiences': json.loads(experiences or '[]'),
+            'education': json.loads(education or '[]'),
+        })
+        c.execute("INSERT INTO candidate_profiles_fts (rowid, profile_text) VALUES (?, ?)", (candidate_id, profile_text))
+
+
+def enrich_candidate_profile(data):
+    # Enrich skills
+    skill_inferences = {
+        "Python": ["Flask", "Fastapi", "Pandas", "Numpy"],
+        "Pytorch": ["Tensorflow", "Python", "Pandas"],
+        "Javascript": ["Nodejs", "React", "Vue", "Angular", "Typescript", "Express"],
+        "Java": ["Spring", "Hibernate", "Junit", "Maven", "Gradle"],
+    }
+
+    enriched_skills = set(data.get('skills', []))
+    for skill in data.get('skills', []):
+        if skill in skill_inferences:
+            enriched_skills.update(skill_inferences[skill])  # Use update to add elements from the list
+    data['skills'] = list(enriched_skills)
+
+    # Calculate experience duration
+    for exp in data.get('experiences', []):
+        start_date = datetime.strptime(exp['start_date'], "%Y-%m-%d")
+        end_date = datetime.strptime(exp['end_date'], "%Y-%m-%d") if exp.get('end_date') else datetime.now()
+        exp['duration_years'] = round((end_date - start_date).days / 365, 1)
+        # Lowercased role used by the explanation matcher, so it is not recomputed per match
+        exp['role_key'] = exp['role'].lower()
+
+    # Determine max education level
+    max_level = "High School"
+    for edu in data.get('education', []):
+        if edu['degree'] in EDUCATION_LEVELS and EDUCATION_LEVELS.index(edu['degree']) > EDUCATION_LEVELS.index(max_level):
+            max_level = edu['degree']
+    data['max_education_level'] = max_level
+
+    # Derived columns for the structured pre-filter
+    data.update(derive_candidate_columns(data.get('experiences', []), max_level))
+    return data
+
+
+def insert_candidate(data: Dict[str, Any], embedding_manager) -> int:
+    """Enrich a candidate profile and store it in SQLite, ChromaDB and the lexical index"""
+    # SQLite would keep anything else as TEXT in the REAL column
+    salary = data.get('expected_salary')
+    if salary is not None and (isinstance(salary, bool) or not isinstance(salary, (int, float))):
+        raise ValueError(f"expected_salary must be a number, got {salary!r}")
+
+    data = enrich_candidate_profile(data)
+
+    conn = sqlite3.connect('ats.db')
+    c = conn.cursor()
+    try:
+        # Insert candidate information including experiences and education as JSON
+        c.execute('''
+            INSERT INTO candidates (
+                first_name, last_name, birthdate, age, email, 
+                phone, address, skills, max_education_level, 
+                experiences, education,
+                closed_experience_years, ongoing_role_start, education_rank, last_role_end, expected_salary
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            data['first_name'],
+            data['last_name'],
+            data['birthdate'],
+            data['age'],
+            data['email'],
+            data['phone'],
+            data['address'],
+            json.dumps(data['skills']),
+            data['max_education_level'],
+            json.dumps(data.get('experiences', [])),  # Convert experiences list to JSON
+            json.dumps(data.get('education', [])),    # Convert education list to JSON
+            data['closed_experience_years'],
+            data['ongoing_role_start'],
+            data['education_rank'],
+            data['last_role_end'],
+            data.get('expected_salary')
+        ))
+        
+        candidate_id = c.lastrowid
+        
+        # Generate and store embedding
+        embedding = embedding_manager.generate_candidate_embedding(data)
+        
+        # Add embedding 
+        embedding_manager.add_candidate(candidate_id, data, embedding)
+        
+        # Store mapping in SQLite
+        c.execute('''
+            INSERT INTO candidate_embeddings (candidate_id, chroma_index)
+            VALUES (?, ?)
+        ''', (candidate_id, candidate_id))
+
+        # Keep the lexical index in sync with the embedded profile text
+        c.execute('''
+            INSERT INTO candidate_profiles_fts (rowid, profile_text)
+            VALUES (?, ?)
+        ''', (candidate_id, build_profile_text(data)))
+
+        # Insert enriched experiences into the experiences table
+        for exp in data.get('experiences', []):
+            c.execute('''
+                INSERT INTO experiences (
+                    candidate_id, company, role, start_date, end_date, duration_years
+                ) VALUES (?, ?, ?, ?, ?, ?)
+            ''', (
+                candidate_id,
+                exp['company'],
+                exp['role'],
+                exp['start_date'],
+                exp.get('end_date'),
+                exp['duration_years']
+            ))
+
+        # Insert education into the education table
+        for edu in data.get('education', []):
+            c.execute('''
+                INSERT INTO education (
+                    candidate_id, institution, degree, year_of_graduation
+                ) VALUES (?, ?, ?, ?)
+            ''', (
+                candidate_id,
+                edu['institution'],
+                edu['degree'],
+                edu['year_of_graduation']
+            ))
+
+        conn.commit()
+
+        return candidate_id
+
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+
+def store_job_matches(job_data, execution_time, ranked_candidates):
+    conn = sqlite3.connect('ats.db')
+    c = conn.cursor()
+    
+    # Generate a unique job ID, the suffix keeps concurrent requests in the same second apart
+    job_id = f"job_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+    
+    # The budget is optional, its columns are stored as NULL when missing
+    budget = job_data.get('budget') or {}
+
+    # Store matches for top 100 candidates
+    for rank, result in enumerate(ranked_candidates[:100], 1):
+        candidate = result['candidate']
+        
+        c.execute('''
+            INSERT INTO job_matches (
+                job_id,
+                execution_time,
+                job_title,
+                job_description,
+                budget_min,
+                budget_max,
+                budget_currency,
+                required_skills,
+                candidate_name,
+                candidate_email,
+                total_score,
+                skill_match_score,
+                semantic_score,
+                skill_matches,
+                experience_relevance
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            job_id,
+            execution_time,
+            job_data['job_title'],
+            job_data['job_description'],
+            budget.get('min'),
+            budget.get('max'),
+            budget.get('currency'),
+            json.dumps(job_data['required_skills']),
+            candidate.full_name,
+            candidate.email,
+            result['score'],
+            result['skill_match_score'],
+            result['semantic_score'],
+            json.dumps(result['explanations']['skill_matches']),
+            json.dumps(result['explanations']['experience_relevance'])
+        ))
+    
+    conn.commit()
+    conn.close()
+    
+    return job_id